@@ -6,6 +6,27 @@ import logging
 import os
 import sys
 import csv
+import re
+import json
+import time
+import threading
+import email.utils
+import types
+import concurrent.futures
+import contextlib
+import collections
+import functools
+import ipaddress
+import itertools
+import requests
+from requests.exceptions import RequestException
+from urllib3.util.retry import Retry
+
+# orjson is optional; when present it replaces stdlib json for API payloads
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # --- Script Configuration ---
 SCRIPT_NAME = 'SASE: Element Prefix List Manager'
@@ -16,6 +37,44 @@ logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(SCRIPT_NAME)
 
+# Default number of elements configured concurrently (--workers). The work is almost
+# entirely network I/O, so threads overlap the API round-trips.
+MAX_WORKERS = 16
+# Queued element writes allowed per worker before CSV parsing pauses for the oldest sites to finish
+QUEUED_UPSERTS_PER_WORKER = 4
+
+# Attempts made after an HTTP 429 before giving up on a call, and the fallback delay base
+# (seconds, doubled per attempt) when the response carries no usable Retry-After header
+RATE_LIMIT_RETRIES = 5
+RATE_LIMIT_BACKOFF = 1.0
+
+# Splits a cell of comma-separated values, absorbing whitespace around each comma
+COMMA_SPLIT_RE = re.compile(r'\s*,\s*')
+
+# Fields of an existing routing_prefixlist carried into the PUT body; everything else is server metadata
+PREFIXLIST_PUT_FIELDS = ('id', '_etag', 'name', 'tags', 'auto_generated')
+
+# Columns read from each input CSV row; missing or short cells become ''
+CsvRow = collections.namedtuple('CsvRow', 'target_sites prefixlist_name prefixes ge le')
+
+# Outcome of applying a prefix list to one element; action is 'fetch', 'create', 'update' or 'unchanged'
+ElementResult = collections.namedtuple('ElementResult', 'element_name action ok detail')
+
+# Request bodies for one CSV group, serialized once and shared by every element in the group
+GroupPayload = collections.namedtuple('GroupPayload', 'description prefix_filter_list prefix_filter_list_json create_body')
+
+# The SDK's default urllib3 retry policy without 429, which call_api() handles for every worker at once.
+# raise_on_status=False returns a final 5xx as a response, which the callers already report.
+SESSION_RETRY_SETTINGS = dict(total=8, other=0, backoff_factor=0.705883, status_forcelist=(413, 502, 503, 504),
+                              raise_on_status=False)
+
+# Seconds of token lifetime left at which call_api() starts running calls one at a time. The SDK refreshes
+# the token inside a call once 60s remain, replacing its requests.Session and rewriting its headers.
+TOKEN_REFRESH_MARGIN = 90
+
+# Local cache of the tenant's sites/elements, used when --cache-ttl is set
+INVENTORY_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'ion_prefix', 'inventory.json')
+
 # --- Attempt to import Prisma SASE credentials ---
 try:
     sys.path.append(os.getcwd())
@@ -27,92 +86,507 @@ except ImportError:
     PRISMASASE_TSG_ID = None
 
 
-def apply_prefixlist_to_element(sase_session, site_id, element_id, element_name, prefixlist_name, prefix_entries):
+class SessionPool:
     """
-    Creates or updates a routing_prefixlist on a single element.
+    Keeps a pooled TlsHttpAdapter, sized for the worker threads, mounted on the SDK's requests.Session.
+    The SDK replaces that session with a default adapter whenever it refreshes its token, so call_api()
+    runs remount() after each call to put the pooled adapter back.
+    refresh_guard() serializes calls near token expiry so only one thread performs the refresh.
+    """
+
+    def __init__(self):
+        self.sase_session = None
+        self.adapter = None
+        self.session = None
+        self.refresh_lock = threading.Lock()
+
+    def configure(self, sase_session, pool_size):
+        """
+        pool_size should cover every worker thread so none waits for a free connection.
+        """
+        self.sase_session = sase_session
+        if not isinstance(sase_session.expose_session(), requests.Session):
+            logger.debug("SDK session does not expose a requests.Session. Using default connection handling.")
+            return
+        # Applied to the SDK's own retry object too, so the adapter it mounts after a refresh also leaves 429 alone
+        sase_session.modify_rest_retry(update_adapter=False, **SESSION_RETRY_SETTINGS)
+        self.adapter = prisma_sase.TlsHttpAdapter(ssl_context=sase_session._ca_ssl_context,
+                                                  pool_connections=pool_size, pool_maxsize=pool_size,
+                                                  max_retries=Retry(**SESSION_RETRY_SETTINGS))
+        self.remount()
+
+    def remount(self):
+        if self.adapter is None:
+            return
+        session = self.sase_session.expose_session()
+        if session is not self.session:
+            self.sase_session.update_session_adapter(adapter=self.adapter)
+            self.session = session
+
+    def refresh_guard(self):
+        if self.sase_session is not None and self.sase_session.jwt_expires_in <= TOKEN_REFRESH_MARGIN:
+            return self.refresh_lock
+        return contextlib.nullcontext()
+
+
+# Shared by every API call; go() configures it on the SDK session before logging in
+session_pool = SessionPool()
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_prefix(prefix_str):
+    """
+    Returns the ip_network for a prefix string (host bits allowed), or None if it is malformed.
+    """
+    try:
+        return ipaddress.ip_network(prefix_str, strict=False)
+    except ValueError:
+        return None
+
+
+def read_prefix_entries(csvfile):
+    """
+    Yields (target_sites, prefixlist_name, prefix_entry) for every prefix in the input CSV,
+    carrying target sites and prefixlist name forward from previous rows when blank.
+    """
+    reader = csv.reader(csvfile)
+    fieldnames = next(reader, [])
+    required_headers = ['target_sites', 'prefixlist_name', 'prefixes']
+    missing_headers = set(required_headers) - set(fieldnames)
+    if missing_headers:
+        logger.error(f"Input CSV must contain headers: {', '.join(required_headers)}. "
+                     f"Missing: {', '.join(h for h in required_headers if h in missing_headers)}.")
+        sys.exit(1)
+
+    # Resolve column positions once, in CsvRow field order; optional columns missing from the header map to None
+    column_index = {h: None for h in CsvRow._fields}
+    for i, header in enumerate(fieldnames):
+        if header in column_index and column_index[header] is None:
+            column_index[header] = i
+    indices = [column_index[f] for f in CsvRow._fields]
+
+    last_target_sites = ""
+    last_prefixlist_name = ""
+    for row in reader:
+        if not row:
+            continue
+        values = CsvRow(*(row[i].strip() if i is not None and i < len(row) else '' for i in indices))
+
+        # Carry forward target sites and prefixlist name from previous rows if blank
+        if values.target_sites:
+            last_target_sites = values.target_sites
+
+        if values.prefixlist_name:
+            last_prefixlist_name = values.prefixlist_name
+
+        prefixes_str = values.prefixes
+        ge_val = values.ge
+        le_val = values.le
+
+        if not prefixes_str:
+            logger.warning(f"Skipping row with no prefixes defined: {row}")
+            continue
+
+        if not last_target_sites or not last_prefixlist_name:
+            logger.warning(f"Skipping row because target sites or prefixlist name is not yet defined: {row}")
+            continue
+
+        # ge/le apply to every prefix in the row, so convert them once. Blank or
+        # non-numeric values default to 0.
+        ge_int = int(ge_val) if ge_val.isdecimal() else 0
+        le_int = int(le_val) if le_val.isdecimal() else 0
+
+        # Handle potentially multiple comma-separated prefixes in a single cell; malformed
+        # prefixes are dropped here rather than being rejected by the API on every element
+        for prefix in COMMA_SPLIT_RE.split(prefixes_str):
+            if not prefix:
+                continue
+            network = parse_prefix(prefix)
+            if network is None:
+                logger.warning(f"Skipping invalid prefix '{prefix}' for prefix list '{last_prefixlist_name}': {row}")
+                continue
+            # Send the canonical network so host bits never reach the API and the unchanged check
+            # compares like with like
+            canonical_prefix = network.with_prefixlen
+            if canonical_prefix != prefix:
+                logger.warning(f"Prefix '{prefix}' is not in canonical network form (e.g. host bits set). "
+                               f"Using '{canonical_prefix}' for prefix list '{last_prefixlist_name}'.")
+            yield last_target_sites, last_prefixlist_name, {
+                "prefix": canonical_prefix,
+                "ipv6": isinstance(network, ipaddress.IPv6Network),
+                "ge": ge_int,
+                "le": le_int
+            }
+
+
+def orjson_dumps(obj, **kwargs):
+    """
+    json.dumps replacement backed by orjson; calls using stdlib-only options fall back to json.
+    """
+    if kwargs:
+        return json.dumps(obj, **kwargs)
+    return orjson.dumps(obj).decode('utf-8')
+
+
+def orjson_loads(s, **kwargs):
+    """
+    json.loads replacement backed by orjson; calls using stdlib-only options fall back to json.
+    """
+    if kwargs:
+        return json.loads(s, **kwargs)
+    return orjson.loads(s)
+
+
+def encode_json(obj):
+    """
+    Serializes an API request body to a compact JSON string, using orjson when available.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def install_orjson():
+    """
+    Points the json references in prisma_sase and requests at orjson, if it is installed.
+    Only modules using the stdlib json module are patched; the json module itself is untouched.
+    """
+    if orjson is None:
+        logger.debug("orjson not installed. Using stdlib json.")
+        return
+
+    json_shim = types.ModuleType('json')
+    json_shim.__dict__.update(vars(json))
+    json_shim.dumps = orjson_dumps
+    json_shim.loads = orjson_loads
+
+    for module_name, module in list(sys.modules.items()):
+        if module_name == 'prisma_sase' or module_name.startswith('prisma_sase.'):
+            if getattr(module, 'json', None) is json:
+                module.json = json_shim
+    if getattr(requests.models, 'complexjson', None) is json:
+        requests.models.complexjson = json_shim
+    logger.debug("Using orjson for API payloads.")
+
+
+class RateLimiter:
+    """
+    Spaces API calls from all worker threads so no more than max_rps start per second (0 disables).
+    pause() holds back every thread, e.g. after the API answers with HTTP 429.
+    """
+
+    def __init__(self, max_rps=0):
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+        self.set_rate(max_rps)
+
+    def set_rate(self, max_rps):
+        self.interval = 1.0 / max_rps if max_rps > 0 else 0
+
+    def pause(self, delay):
+        with self.lock:
+            self.next_slot = max(self.next_slot, time.monotonic() + delay)
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Shared by every API call; go() applies --max-rps to it
+rate_limiter = RateLimiter()
+
+
+def retry_after_seconds(resp, attempt):
+    """
+    Returns how long to wait before retrying a 429 response, preferring its Retry-After header.
+    """
+    retry_after = resp.headers.get('Retry-After') if resp.headers else None
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                retry_at = email.utils.parsedate_to_datetime(retry_after)
+                return max(0.0, retry_at.timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return RATE_LIMIT_BACKOFF * (2 ** attempt)
+
+
+def call_api(api_function, *args, **kwargs):
+    """
+    Calls a prisma_sase API function under the shared rate limiter, retrying on HTTP 429.
+    A 429 pauses the limiter, so every worker backs off rather than only the one that was throttled.
+    Calls near token expiry run one at a time, and the pooled adapter is remounted if the SDK
+    swapped its session during the call.
+    Raises RequestException when the SDK gives back no response object, so callers report it like
+    any other network failure.
+    """
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        rate_limiter.wait()
+        with session_pool.refresh_guard():
+            resp = api_function(*args, **kwargs)
+            session_pool.remount()
+        # rest_call() swallows timeouts and connection errors and returns the requests.Response
+        # class itself, or False when the token refresh fails
+        if not isinstance(resp, requests.Response):
+            raise RequestException("No response from the API (connection error, timeout or token refresh failure)")
+        if resp.status_code != 429 or attempt == RATE_LIMIT_RETRIES:
+            return resp
+        delay = retry_after_seconds(resp, attempt)
+        logger.warning(f"    - Rate limited by API. Retrying in {delay:.1f}s ({attempt + 1}/{RATE_LIMIT_RETRIES})...")
+        rate_limiter.pause(delay)
+
+
+def fetch_existing_prefixlists(sase_session, site_name, site_id, element_id, element_name):
+    """
+    Returns the routing_prefixlists on a single element keyed by name, or None on failure.
     """
-    logger.info(f"  -> Checking element '{element_name}' for prefix list '{prefixlist_name}'...")
-    
-    # 1. Get all existing prefix lists on this specific element
     existing_prefixlists_on_element = {}
     try:
-        resp = sase_session.get.routing_prefixlists(site_id=site_id, element_id=element_id)
+        resp = call_api(sase_session.get.routing_prefixlists, site_id=site_id, element_id=element_id)
         if resp.ok:
             for pl in resp.json().get('items', []):
                 existing_prefixlists_on_element[pl['name']] = pl
         else:
-            logger.error(f"    - FAILURE: Could not get prefix lists for element '{element_name}'. Status: {resp.status_code}, Info: {resp.text}")
-            return
-    except Exception as e:
-        logger.error(f"    - EXCEPTION: An error occurred while getting prefix lists for element '{element_name}': {e}")
-        return
+            logger.error(f"    - FAILURE: Could not get prefix lists for element '{element_name}' at site '{site_name}'. Status: {resp.status_code}, Info: {resp.text}")
+            return None
+    except (RequestException, ValueError) as e:
+        logger.error(f"    - EXCEPTION: An error occurred while getting prefix lists for element '{element_name}' at site '{site_name}': {e}")
+        return None
+    return existing_prefixlists_on_element
+
 
-    # 2. Prepare the list of prefix entries
+def build_prefix_filter_list(prefix_entries):
+    """
+    Converts grouped CSV prefix entries (with integer ge/le) into the prefix_filter_list payload format.
+    IPv6 prefixes are sent in ipv6_prefix instead of prefix.
+    """
     prefix_filter_list_entries = []
     for i, entry_data in enumerate(prefix_entries):
-        prefix_str = entry_data.get('prefix')
-        ge_val_str = entry_data.get('ge', '0')
-        le_val_str = entry_data.get('le', '0')
-
-        try:
-            ge_val = int(ge_val_str) if ge_val_str else 0
-        except (ValueError, TypeError):
-            ge_val = 0
-        try:
-            le_val = int(le_val_str) if le_val_str else 0
-        except (ValueError, TypeError):
-            le_val = 0
-
         entry = {
             "order": (i + 1) * 10,
             "permit": True,
-            "prefix": prefix_str,
-            "ipv6_prefix": None,
-            "ge": ge_val,
-            "le": le_val
+            "prefix": None if entry_data['ipv6'] else entry_data['prefix'],
+            "ipv6_prefix": entry_data['prefix'] if entry_data['ipv6'] else None,
+            "ge": entry_data['ge'],
+            "le": entry_data['le']
         }
         prefix_filter_list_entries.append(entry)
-    
-    # 3. Check if our target prefix list exists on this element
+
+    return prefix_filter_list_entries
+
+
+def build_group_payload(prefixlist_name, prefix_filter_list_entries):
+    """
+    Pre-serializes the POST body and the prefix_filter_list JSON shared by all elements of a group.
+    """
+    description = f"Prefix list '{prefixlist_name}'. Managed by script."
+    create_payload = {
+        "name": prefixlist_name,
+        "description": description,
+        "tags": None,
+        "auto_generated": False,
+        "prefix_filter_list": prefix_filter_list_entries
+    }
+    return GroupPayload(description, prefix_filter_list_entries, encode_json(prefix_filter_list_entries),
+                        encode_json(create_payload))
+
+
+def normalize_prefix_filter_list(prefix_filter_list):
+    """
+    Returns a comparable form of a prefix_filter_list, ignoring server-side fields and ordering.
+    """
+    return sorted(
+        (entry.get('order'), bool(entry.get('permit')), entry.get('prefix'), entry.get('ipv6_prefix'),
+         entry.get('ge') or 0, entry.get('le') or 0)
+        for entry in (prefix_filter_list or [])
+    )
+
+
+def apply_prefixlist_to_element(sase_session, site_name, site_id, element_id, element_name, prefixlist_name, group_payload, existing_prefixlists_on_element):
+    """
+    Creates or updates a routing_prefixlist on a single element.
+    group_payload is the GroupPayload shared by every element in the group and is not modified.
+    existing_prefixlists_on_element is the name-keyed map from fetch_existing_prefixlists().
+    Returns an ElementResult; failures are logged immediately, successes are left to the site summary.
+    """
+    logger.debug("  -> Checking element '%s' for prefix list '%s'...", element_name, prefixlist_name)
+
+    # Check if our target prefix list exists on this element
     if prefixlist_name in existing_prefixlists_on_element:
         # It exists, so we will update it using PUT
         existing_pl = existing_prefixlists_on_element[prefixlist_name]
         prefixlist_id = existing_pl['id']
-        
-        # Use the existing object as the base for the payload to preserve _etag
-        payload = existing_pl.copy()
-        
-        # Update the fields we want to change
-        payload['description'] = f"Prefix list '{prefixlist_name}'. Managed by script."
-        payload['prefix_filter_list'] = prefix_filter_list_entries
-        
-        logger.info(f"    - Prefix list '{prefixlist_name}' exists. Updating...")
+
+        # Skip the write entirely if the element already has the desired state
+        if (existing_pl.get('description') == group_payload.description and
+                normalize_prefix_filter_list(existing_pl.get('prefix_filter_list')) ==
+                normalize_prefix_filter_list(group_payload.prefix_filter_list)):
+            logger.debug("    - Prefix list '%s' is already up to date on '%s'. No changes needed.", prefixlist_name, element_name)
+            return ElementResult(element_name, 'unchanged', True, '')
+
+        # Carry over only the fields the PUT needs from the existing object (including _etag),
+        # leaving read-only server metadata out of the request body
+        payload = {k: existing_pl[k] for k in PREFIXLIST_PUT_FIELDS if k in existing_pl}
+
+        # Update the fields we want to change, then splice in the group's pre-serialized
+        # prefix_filter_list so only the small per-element part is encoded here
+        payload['description'] = group_payload.description
+        body = f'{encode_json(payload)[:-1]},"prefix_filter_list":{group_payload.prefix_filter_list_json}}}'
+
+        logger.debug("    - Prefix list '%s' exists on '%s'. Updating...", prefixlist_name, element_name)
         try:
-            resp = sase_session.put.routing_prefixlists(site_id=site_id, element_id=element_id, routing_prefixlist_id=prefixlist_id, data=payload)
+            resp = call_api(sase_session.put.routing_prefixlists, site_id=site_id, element_id=element_id, routing_prefixlist_id=prefixlist_id, data=body)
             if resp.ok:
-                logger.info(f"    - SUCCESS: Updated prefix list on '{element_name}'.")
-            else:
-                logger.error(f"    - FAILURE: Could not update prefix list on '{element_name}'. Status: {resp.status_code}, Info: {resp.text}")
-        except Exception as e:
-            logger.error(f"    - EXCEPTION: An error occurred while updating prefix list on '{element_name}': {e}")
+                logger.debug("    - SUCCESS: Updated prefix list on '%s'.", element_name)
+                return ElementResult(element_name, 'update', True, '')
+            logger.error(f"    - FAILURE: Could not update prefix list '{prefixlist_name}' on '{element_name}' at site '{site_name}'. Status: {resp.status_code}, Info: {resp.text}")
+            return ElementResult(element_name, 'update', False, f"Status: {resp.status_code}")
+        except RequestException as e:
+            logger.error(f"    - EXCEPTION: An error occurred while updating prefix list '{prefixlist_name}' on '{element_name}' at site '{site_name}': {e}")
+            return ElementResult(element_name, 'update', False, str(e))
     else:
-        # It does not exist, so we will create it using POST
-        payload = {
-            "name": prefixlist_name,
-            "description": f"Prefix list '{prefixlist_name}'. Managed by script.",
-            "tags": None,
-            "auto_generated": False,
-            "prefix_filter_list": prefix_filter_list_entries
-        }
-        logger.info(f"    - Prefix list '{prefixlist_name}' does not exist. Creating...")
+        # It does not exist, so we will create it using POST with the group's pre-serialized body
+        logger.debug("    - Prefix list '%s' does not exist on '%s'. Creating...", prefixlist_name, element_name)
         try:
-            resp = sase_session.post.routing_prefixlists(site_id=site_id, element_id=element_id, data=payload)
+            resp = call_api(sase_session.post.routing_prefixlists, site_id=site_id, element_id=element_id, data=group_payload.create_body)
             if resp.ok:
-                logger.info(f"    - SUCCESS: Created prefix list on '{element_name}'.")
-            else:
-                logger.error(f"    - FAILURE: Could not create prefix list on '{element_name}'. Status: {resp.status_code}, Info: {resp.text}")
-        except Exception as e:
-            logger.error(f"    - EXCEPTION: An error occurred while creating prefix list on '{element_name}': {e}")
+                logger.debug("    - SUCCESS: Created prefix list on '%s'.", element_name)
+                return ElementResult(element_name, 'create', True, '')
+            logger.error(f"    - FAILURE: Could not create prefix list '{prefixlist_name}' on '{element_name}' at site '{site_name}'. Status: {resp.status_code}, Info: {resp.text}")
+            return ElementResult(element_name, 'create', False, f"Status: {resp.status_code}")
+        except RequestException as e:
+            logger.error(f"    - EXCEPTION: An error occurred while creating prefix list '{prefixlist_name}' on '{element_name}' at site '{site_name}': {e}")
+            return ElementResult(element_name, 'create', False, str(e))
+
+
+def apply_after_fetch(fetch_future, previous_upsert, sase_session, site_name, site_id, element_id, element_name, prefixlist_name, group_payload):
+    """
+    Waits for an element's prefix lists to be fetched, then creates or updates the target list.
+    previous_upsert is the earlier queued write of the same list to the same element, if any; it is
+    awaited and the prefix lists are fetched again so this write sees its result and current _etag.
+    """
+    if previous_upsert is None:
+        existing_prefixlists_on_element = fetch_future.result()
+    else:
+        previous_upsert.result()
+        existing_prefixlists_on_element = fetch_existing_prefixlists(sase_session, site_name, site_id, element_id, element_name)
+    if existing_prefixlists_on_element is None:
+        return ElementResult(element_name, 'fetch', False, "Could not get existing prefix lists")
+    return apply_prefixlist_to_element(sase_session, site_name, site_id, element_id, element_name,
+                                       prefixlist_name, group_payload, existing_prefixlists_on_element)
+
+
+def queue_prefixlist_group(sase_session, fetch_executor, upsert_executor, all_sites_map, elements_by_site,
+                           existing_futures, pending_upserts, target_sites_str, prefixlist_name, prefix_entries):
+    """
+    Queues one CSV group for every element at its target sites.
+    Each element's prefix lists are fetched once; existing_futures maps element_id to that fetch.
+    pending_upserts maps (element_id, prefixlist_name) to the last write queued for it, so writes
+    to the same list on the same element run one after another, in CSV order.
+    Returns a list of (site_name, prefixlist_name, upsert_futures), one per site with elements.
+    """
+    site_batches = []
+    target_site_names = [s.strip() for s in target_sites_str.split(',') if s.strip()]
+    # The payload is identical for every element in this group, so build and serialize it once
+    group_payload = build_group_payload(prefixlist_name, build_prefix_filter_list(prefix_entries))
+
+    for site_name in target_site_names:
+        logger.info(f"\n--- Applying prefix list '{prefixlist_name}' to site: {site_name} ---")
+
+        if site_name not in all_sites_map:
+            logger.warning(f"Target site '{site_name}' from CSV not found in tenant. Skipping.")
+            continue
+
+        site_id = all_sites_map[site_name]['id']
+        elements_at_site = elements_by_site.get(site_id, [])
+
+        if not elements_at_site:
+            logger.info(f"No elements found at site '{site_name}'.")
+            continue
+
+        # Apply the full list of grouped prefixes to every element at this site
+        upsert_futures = []
+        for element in elements_at_site:
+            element_id, element_name = element['id'], element['name']
+            if element_id not in existing_futures:
+                existing_futures[element_id] = fetch_executor.submit(
+                    fetch_existing_prefixlists, sase_session, site_name, site_id, element_id, element_name)
+            write_key = (element_id, prefixlist_name)
+            upsert_future = upsert_executor.submit(
+                apply_after_fetch, existing_futures[element_id], pending_upserts.get(write_key), sase_session,
+                site_name, site_id, element_id, element_name, prefixlist_name, group_payload)
+            pending_upserts[write_key] = upsert_future
+            upsert_futures.append(upsert_future)
+        site_batches.append((site_name, prefixlist_name, upsert_futures))
+
+    return site_batches
+
+
+def log_site_summary(site_name, prefixlist_name, results):
+    """
+    Logs one summary line for a prefix list applied across the elements of a site,
+    followed by the failed elements and why, if any.
+    """
+    counts = collections.Counter(result.action if result.ok else 'failed' for result in results)
+    logger.info(f"Site '{site_name}', prefix list '{prefixlist_name}': {counts['update']} updated, "
+                f"{counts['create']} created, {counts['unchanged']} unchanged, {counts['failed']} failed.")
+    failures = [f"{result.element_name} ({result.action}: {result.detail})" for result in results if not result.ok]
+    if failures:
+        logger.warning(f"  Failed on site '{site_name}', prefix list '{prefixlist_name}': {', '.join(failures)}")
+
+
+def load_cached_inventory(tsg_id, ttl):
+    """
+    Returns (sites, elements) cached for tsg_id if younger than ttl seconds, otherwise None.
+    An unreadable, partial or hand-edited cache is treated as a miss.
+    """
+    try:
+        with open(INVENTORY_CACHE_FILE, mode='r', encoding='utf-8') as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+
+    # JSON object keys are always strings, so an int TSG ID from the settings file is matched as str
+    entry = cache.get(str(tsg_id)) if isinstance(cache, dict) else None
+    if not isinstance(entry, dict):
+        return None
+    ts, sites, elements = entry.get('ts'), entry.get('sites'), entry.get('elements')
+    if not isinstance(ts, (int, float)) or isinstance(ts, bool) or time.time() - ts >= ttl:
+        return None
+    if not isinstance(sites, list) or not isinstance(elements, list):
+        return None
+    if not all(isinstance(item, dict) and 'id' in item and 'name' in item for item in sites + elements):
+        return None
+    return sites, elements
+
+
+def save_cached_inventory(tsg_id, sites, elements):
+    """
+    Stores the sites/elements inventory for tsg_id, replacing the cache file atomically.
+    """
+    try:
+        with open(INVENTORY_CACHE_FILE, mode='r', encoding='utf-8') as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        cache = {}
+    if not isinstance(cache, dict):
+        cache = {}
+    cache[str(tsg_id)] = {'ts': time.time(), 'sites': sites, 'elements': elements}
+
+    try:
+        os.makedirs(os.path.dirname(INVENTORY_CACHE_FILE), exist_ok=True)
+        tmp_path = f"{INVENTORY_CACHE_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, mode='w', encoding='utf-8') as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(tmp_path, INVENTORY_CACHE_FILE)
+    except OSError as e:
+        logger.warning(f"Could not write inventory cache '{INVENTORY_CACHE_FILE}': {e}")
 
 
 def go():
@@ -122,8 +596,17 @@ def go():
     parser = argparse.ArgumentParser(description=f"{SCRIPT_NAME} - {SCRIPT_VERSION}")
     parser.add_argument("csv_filepath", help="Path to the input CSV file containing site and prefix information.")
     parser.add_argument("--debug", action="store_true", help="Enable debug logging.")
+    parser.add_argument("--cache-ttl", type=int, default=0,
+                        help="Reuse the sites/elements inventory cached by a previous run if it is younger than "
+                             "this many seconds. Default 0 (always fetch).")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help=f"Number of concurrent API calls for reads and for writes. Default {MAX_WORKERS}.")
+    parser.add_argument("--max-rps", type=float, default=0,
+                        help="Maximum API requests started per second across all workers. Default 0 (unlimited).")
     
     args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1.")
 
     if args.debug:
         logger.setLevel(logging.DEBUG)
@@ -135,8 +618,13 @@ def go():
         logger.error("Prisma SASE API credentials not configured.")
         sys.exit(1)
 
+    rate_limiter.set_rate(args.max_rps)
+
+    install_orjson()
     sase_session = prisma_sase.API()
     sase_session.set_debug(2 if args.debug else 0)
+    # Fetch and upsert pools each run args.workers threads
+    session_pool.configure(sase_session, 2 * args.workers)
     
     logger.info("Attempting to log in...")
     if not sase_session.interactive.login_secret(client_id=PRISMASASE_CLIENT_ID, client_secret=PRISMASASE_CLIENT_SECRET, tsg_id=PRISMASASE_TSG_ID):
@@ -145,99 +633,86 @@ def go():
     
     logger.info(f"Successfully logged in. Tenant ID: {sase_session.tenant_id}")
     
-    # Pre-fetch all sites and elements for efficiency
-    logger.info("Fetching all sites and elements...")
+    # Pre-fetch all sites and elements for efficiency, reusing a recent cached copy if allowed
     all_sites_map = {}
-    all_elements = []
-    try:
-        sites_resp = sase_session.get.sites()
-        elements_resp = sase_session.get.elements()
-        if not sites_resp.ok or not elements_resp.ok:
-            logger.error("Failed to pre-fetch sites or elements. Exiting.")
+    elements_by_site = {}
+    cached_inventory = load_cached_inventory(PRISMASASE_TSG_ID, args.cache_ttl) if args.cache_ttl > 0 else None
+    if cached_inventory:
+        logger.info(f"Using cached sites and elements from '{INVENTORY_CACHE_FILE}'.")
+        sites, elements = cached_inventory
+    else:
+        logger.info("Fetching all sites and elements...")
+        try:
+            sites_resp = call_api(sase_session.get.sites)
+            elements_resp = call_api(sase_session.get.elements)
+            if not sites_resp.ok or not elements_resp.ok:
+                logger.error("Failed to pre-fetch sites or elements. Exiting.")
+                sys.exit(1)
+
+            sites = sites_resp.json().get('items', [])
+            elements = elements_resp.json().get('items', [])
+        except (RequestException, ValueError) as e:
+            logger.error(f"An error occurred during pre-fetch: {e}")
             sys.exit(1)
-            
-        for site in sites_resp.json().get('items', []):
-            all_sites_map[site['name']] = site
-        all_elements = elements_resp.json().get('items', [])
-        logger.info(f"Found {len(all_sites_map)} sites and {len(all_elements)} elements.")
-    except Exception as e:
-        logger.error(f"An error occurred during pre-fetch: {e}")
-        sys.exit(1)
+        if args.cache_ttl > 0:
+            save_cached_inventory(PRISMASASE_TSG_ID, sites, elements)
+
+    for site in sites:
+        all_sites_map[site['name']] = site
+    # Index elements by site so each site lookup is a single dict access
+    for element in elements:
+        elements_by_site.setdefault(element.get('site_id'), []).append(element)
+    logger.info(f"Found {len(all_sites_map)} sites and {len(elements)} elements.")
 
-    # Process the input CSV file
+    # Process the input CSV file. Each group is queued as soon as it ends, so API calls
+    # run while the rest of the file is still being read. Once too many writes are queued, parsing
+    # waits for the oldest sites to finish (and logs their summaries), which bounds memory to the
+    # queued groups plus one fetched prefix-list map and one write entry per element and list name.
+    # The parsed prefix entries of each (sites, list name) key are also kept, so that a key repeated
+    # later in the CSV is written as the union of all its blocks, as when every row is grouped up front.
+    # Reads and writes use separate pools so a write waiting on its fetch never starves the reads.
+    # A write only waits on writes submitted before it, so the FIFO upsert pool cannot deadlock.
+    # The prisma_sase session is shared by every worker. Its token refresh replaces the session and
+    # rewrites its headers, so call_api() serializes calls while the token is close to expiry.
     try:
-        grouped_tasks = {}
-        last_target_sites = ""
-        last_prefixlist_name = ""
-        
-        with open(args.csv_filepath, mode='r', encoding='utf-8-sig') as csvfile:
-            reader = csv.DictReader(csvfile)
-            required_headers = ['target_sites', 'prefixlist_name', 'prefixes']
-            if not all(h in reader.fieldnames for h in required_headers):
-                logger.error(f"Input CSV must contain headers: {', '.join(required_headers)}.")
-                sys.exit(1)
-                
-            for row in reader:
-                # Carry forward target sites and prefixlist name from previous rows if blank
-                current_target_sites = row.get('target_sites', '').strip()
-                if current_target_sites:
-                    last_target_sites = current_target_sites
-                
-                current_prefixlist_name = row.get('prefixlist_name', '').strip()
-                if current_prefixlist_name:
-                    last_prefixlist_name = current_prefixlist_name
-                
-                prefixes_str = row.get('prefixes', '').strip()
-                ge_val = row.get('ge', '').strip()
-                le_val = row.get('le', '').strip()
-
-                if not prefixes_str:
-                    logger.warning(f"Skipping row with no prefixes defined: {row}")
-                    continue
-
-                if not last_target_sites or not last_prefixlist_name:
-                    logger.warning(f"Skipping row because target sites or prefixlist name is not yet defined: {row}")
-                    continue
-                
-                # Create a key to group prefixes by site and list name
-                group_key = (last_target_sites, last_prefixlist_name)
-                if group_key not in grouped_tasks:
-                    grouped_tasks[group_key] = []
-                
-                # Handle potentially multiple comma-separated prefixes in a single cell
-                for prefix in [p.strip() for p in prefixes_str.split(',') if p.strip()]:
-                    grouped_tasks[group_key].append({
-                        "prefix": prefix,
-                        "ge": ge_val,
-                        "le": le_val
-                    })
-
-        # Once the entire CSV is read and grouped, process the tasks
-        for (target_sites_str, prefixlist_name), prefix_entries in grouped_tasks.items():
-            target_site_names = [s.strip() for s in target_sites_str.split(',') if s.strip()]
-
-            for site_name in target_site_names:
-                logger.info(f"\n--- Applying prefix list '{prefixlist_name}' to site: {site_name} ---")
-
-                if site_name not in all_sites_map:
-                    logger.warning(f"Target site '{site_name}' from CSV not found in tenant. Skipping.")
-                    continue
-                
-                site_id = all_sites_map[site_name]['id']
-                elements_at_site = [elem for elem in all_elements if elem.get('site_id') == site_id]
-
-                if not elements_at_site:
-                    logger.info(f"No elements found at site '{site_name}'.")
-                    continue
-
-                # Apply the full list of grouped prefixes to every element at this site
-                for element in elements_at_site:
-                    apply_prefixlist_to_element(sase_session, site_id, element['id'], element['name'], prefixlist_name, prefix_entries)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as fetch_executor, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as upsert_executor:
+            existing_futures = {}
+            pending_upserts = {}
+            site_batches = collections.deque()
+            queued_upserts = 0
+            max_queued_upserts = QUEUED_UPSERTS_PER_WORKER * args.workers
+            queued_groups = {}
+
+            with open(args.csv_filepath, mode='r', encoding='utf-8-sig') as csvfile:
+                # Carried-forward rows are contiguous, so groupby yields each group as soon as it ends
+                for group_key, group_rows in itertools.groupby(read_prefix_entries(csvfile), key=lambda t: t[:2]):
+                    prefix_entries = [entry for _, _, entry in group_rows]
+                    if group_key in queued_groups:
+                        logger.warning(f"Prefix list '{group_key[1]}' for sites '{group_key[0]}' appears again in a "
+                                       f"later block of the CSV. Its prefixes are merged with the earlier blocks and the combined list is applied.")
+                        prefix_entries = queued_groups[group_key] + prefix_entries
+                    queued_groups[group_key] = prefix_entries
+                    new_batches = queue_prefixlist_group(
+                        sase_session, fetch_executor, upsert_executor, all_sites_map, elements_by_site,
+                        existing_futures, pending_upserts, group_key[0], group_key[1], prefix_entries)
+                    site_batches.extend(new_batches)
+                    queued_upserts += sum(len(upsert_futures) for _, _, upsert_futures in new_batches)
+
+                    # Summarize each site in CSV order; result() also surfaces any unexpected worker error
+                    while queued_upserts > max_queued_upserts:
+                        site_name, prefixlist_name, upsert_futures = site_batches.popleft()
+                        log_site_summary(site_name, prefixlist_name, [future.result() for future in upsert_futures])
+                        queued_upserts -= len(upsert_futures)
+
+            while site_batches:
+                site_name, prefixlist_name, upsert_futures = site_batches.popleft()
+                log_site_summary(site_name, prefixlist_name, [future.result() for future in upsert_futures])
 
     except FileNotFoundError:
         logger.error(f"Input CSV file not found: {args.csv_filepath}")
         sys.exit(1)
-    except Exception as e:
+    except (OSError, csv.Error, UnicodeDecodeError) as e:
         logger.error(f"An error occurred while processing CSV: {e}")
         sys.exit(1)
 
@@ -0,0 +1,67 @@
+import importlib.util
+import logging
+import os
+import types
+import unittest
+
+import requests
+from requests.exceptions import RequestException
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ION prefix list.py')
+
+spec = importlib.util.spec_from_file_location('ion_prefix_list', SCRIPT_PATH)
+ion_prefix_list = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ion_prefix_list)
+
+
+def sdk_session(failure):
+    """
+    Returns a stand-in for prisma_sase.API whose calls all give back `failure`, as rest_call() does
+    on a timeout/connection error (the requests.Response class) or a failed token refresh (False).
+    """
+    def api_function(**kwargs):
+        return failure
+
+    namespace = types.SimpleNamespace(routing_prefixlists=api_function, sites=api_function, elements=api_function)
+    return types.SimpleNamespace(get=namespace, put=namespace, post=namespace, jwt_expires_in=3600)
+
+
+class SdkFailureReturnTests(unittest.TestCase):
+    """
+    The SDK reports network failures by return value rather than by raising.
+    """
+
+    failures = (requests.Response, False)
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_call_api_raises_request_exception(self):
+        for failure in self.failures:
+            with self.subTest(failure=failure):
+                sase_session = sdk_session(failure)
+                with self.assertRaises(RequestException):
+                    ion_prefix_list.call_api(sase_session.get.sites)
+
+    def test_fetch_reports_failure(self):
+        for failure in self.failures:
+            with self.subTest(failure=failure):
+                result = ion_prefix_list.fetch_existing_prefixlists(sdk_session(failure), 'Site1', 'site', 'element', 'E1')
+                self.assertIsNone(result)
+
+    def test_create_and_update_report_failure(self):
+        group_payload = ion_prefix_list.build_group_payload('PL1', [])
+        existing = {'PL1': {'id': 'pl1', '_etag': 1, 'name': 'PL1', 'prefix_filter_list': [{'prefix': '10.0.0.0/8'}]}}
+        for failure in self.failures:
+            for existing_prefixlists, action in (({}, 'create'), (existing, 'update')):
+                with self.subTest(failure=failure, action=action):
+                    result = ion_prefix_list.apply_prefixlist_to_element(
+                        sdk_session(failure), 'Site1', 'site', 'element', 'E1', 'PL1', group_payload, existing_prefixlists)
+                    self.assertEqual((result.action, result.ok), (action, False))
+
+
+if __name__ == '__main__':
+    unittest.main()